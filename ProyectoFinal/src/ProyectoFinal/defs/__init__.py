@@ -5,6 +5,7 @@ from . import assets
 defs = Definitions(
     assets=[
         assets.leer_datos,
+        assets.perfilado,
         assets.datos_procesados,
         assets.metrica_incidencia_7d,
         assets.metrica_factor_crec_7d,
@@ -1,40 +1,201 @@
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
 import dagster as dg
 from datetime import datetime
-from io import StringIO
 import requests
 
+# ✅ Copy-on-Write: sin copias defensivas (ya es el comportamiento en pandas >= 3)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
 # Países de interés
 PERU_ECUADOR = ["Peru", "Ecuador"]
 
+# URL canónica del dataset y carpeta local de caché
+URL_OWID = "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/owid-covid-data.csv"
+CACHE_DIR = Path.home() / ".cache" / "owid"
+
+# Columnas que se leen del CSV y su tipo ("date" se parsea aparte, tolerando errores)
+TIPOS_COLUMNAS = {
+    "location": pa.string(),
+    "date": pa.string(),
+    "new_cases": pa.float64(),
+    "people_vaccinated": pa.float64(),
+    "population": pa.float64(),
+}
+
+
+# ---------------------------------------------------------
+# Descarga con caché en disco (GET condicional)
+# ---------------------------------------------------------
+def descargar_csv(url: str = URL_OWID) -> Path:
+    """Descarga `url` a CACHE_DIR y devuelve la ruta local.
+
+    Si ya existe una copia, se envían `If-None-Match` / `If-Modified-Since`
+    y ante un 304 se reutiliza el archivo sin volver a descargarlo.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    destino = CACHE_DIR / url.rsplit("/", 1)[-1]
+    meta_path = destino.with_suffix(".json")
+
+    headers = {}
+    if destino.exists() and meta_path.exists():
+        meta = json.loads(meta_path.read_text())
+        if meta.get("url") == url:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+    # ✅ stream=True: el cuerpo va directo a disco sin cargarlo completo en memoria
+    tmp = None
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                return destino
+
+            # ✅ Temporal con nombre único: ejecuciones concurrentes no se pisan
+            with tempfile.NamedTemporaryFile(
+                dir=CACHE_DIR, prefix=destino.name + ".", suffix=".tmp", delete=False
+            ) as f:
+                tmp = Path(f.name)
+                for bloque in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(bloque)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+        # ✅ Escritura atómica: no dejar un CSV a medias en la caché
+        tmp.replace(destino)
+        tmp = None
+    except (requests.RequestException, OSError) as e:
+        raise Exception(f"❌ Error al descargar datos: {e}")
+    finally:
+        if tmp is not None:
+            tmp.unlink(missing_ok=True)
+
+    meta_path.write_text(json.dumps({
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+    }))
+    return destino
+
+# ---------------------------------------------------------
+# Ventanas móviles sobre segmentos contiguos por país
+# ---------------------------------------------------------
+def _inicios_segmentos(df: pd.DataFrame) -> np.ndarray:
+    """Posición de la primera fila de cada país en un frame ordenado por location."""
+    # ✅ Sin groupby: en datos ordenados basta con detectar dónde cambia el país
+    loc = df["location"].to_numpy()
+    cambios = np.flatnonzero(loc[1:] != loc[:-1]) + 1
+    return np.concatenate(([0], cambios)) if len(loc) else cambios
+
+
+def _posicion_en_segmento(n: int, inicios: np.ndarray) -> np.ndarray:
+    """Índice de cada fila relativo al inicio de su segmento."""
+    filas = np.arange(n)
+    segmento = np.searchsorted(inicios, filas, side="right") - 1
+    return filas - inicios[segmento]
+
+
+def _desplazar(valores: np.ndarray, inicios: np.ndarray, pasos: int) -> np.ndarray:
+    """Equivale a `groupby("location").shift(pasos)` sobre el frame ordenado."""
+    x = np.asarray(valores, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    out[pasos:] = x[:len(x) - pasos]
+    out[_posicion_en_segmento(len(x), inicios) < pasos] = np.nan
+    return out
+
+
+def _suma_movil(valores: np.ndarray, inicios: np.ndarray, ventana: int = 7) -> np.ndarray:
+    """Suma móvil de `ventana` filas sin cruzar el límite entre segmentos.
+
+    Equivale a `groupby("location").rolling(ventana).sum()` sobre el frame
+    ordenado: NaN mientras la ventana esté incompleta o contenga algún NaN
+    o ±inf.
+    """
+    x = np.asarray(valores, dtype=np.float64)
+    n = len(x)
+    # ✅ ±inf se trata como NaN: si entrara al acumulado contaminaría
+    # todas las ventanas posteriores, incluidas las del siguiente país
+    nulos = ~np.isfinite(x)
+
+    # Acumulados con un 0 inicial: suma(x[i-v+1..i]) = acum[i+1] - acum[i+1-v]
+    acum = np.concatenate(([0.0], np.cumsum(np.where(nulos, 0.0, x))))
+    acum_nulos = np.concatenate(([0], np.cumsum(nulos)))
+
+    completas = _posicion_en_segmento(n, inicios) >= ventana - 1
+
+    fin = np.flatnonzero(completas) + 1
+    suma = acum[fin] - acum[fin - ventana]
+    sin_nulos = acum_nulos[fin] == acum_nulos[fin - ventana]
+
+    out = np.full(n, np.nan)
+    out[completas] = np.where(sin_nulos, suma, np.nan)
+    return out
+
+
+# ---------------------------------------------------------
+# Unicidad de claves con el hash multihilo de Arrow
+# ---------------------------------------------------------
+def _contar_duplicados(df: pd.DataFrame, claves: list) -> int:
+    """Filas que repiten una combinación de `claves` (como `duplicated(subset=claves).sum()`)."""
+    tabla = pa.Table.from_pandas(df[claves], preserve_index=False)
+    return len(df) - tabla.group_by(claves).aggregate([]).num_rows
+
+
 # ---------------------------------------------------------
 # Asset: Leer datos desde URL canónica
 # ---------------------------------------------------------
 @dg.asset(
     automation_condition=dg.AutomationCondition.eager(),
-    description="Descarga el dataset completo desde OWID (sin transformar)."
+    description="Descarga el dataset desde OWID y lee solo las filas de Ecuador y Perú."
 )
 def leer_datos() -> pd.DataFrame:
-    # ✅ URL corregida (sin espacios extra)
-    URL = "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/owid-covid-data.csv"
-    
-    try:
-        response = requests.get(URL, timeout=30)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        raise Exception(f"❌ Error al descargar datos: {e}")
+    ruta_csv = descargar_csv(URL_OWID)
 
+    # ✅ Filtro de países aplicado durante el escaneo del CSV (por lotes)
+    pais = pc.utf8_title(pc.utf8_trim_whitespace(pc.field("location")))
     try:
-        df = pd.read_csv(
-            StringIO(response.text),
-            usecols=["location", "date", "new_cases", "people_vaccinated", "population"]
+        dataset = ds.dataset(
+            ruta_csv,
+            format=ds.CsvFileFormat(
+                convert_options=pv.ConvertOptions(column_types=TIPOS_COLUMNAS)
+            ),
+        )
+        faltantes = [col for col in TIPOS_COLUMNAS if col not in dataset.schema.names]
+        if faltantes:
+            raise KeyError(faltantes)
+
+        tabla = dataset.to_table(
+            columns=list(TIPOS_COLUMNAS),
+            filter=pais.isin(PERU_ECUADOR),
         )
     except KeyError as e:
         raise Exception(f"❌ Columna faltante en CSV: {e}")
+    except pa.ArrowInvalid as e:
+        raise Exception(f"❌ Error de conversión en CSV: {e}")
+
+    # ✅ Fechas inválidas -> NaT (como errors="coerce"), sin abortar la carga
+    fechas = pc.strptime(tabla["date"], format="%Y-%m-%d", unit="ns", error_is_null=True)
+    tabla = tabla.set_column(tabla.schema.get_field_index("date"), "date", fechas)
 
-    # ✅ Convertir tipos
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df["location"] = df["location"].astype(str).str.strip().str.title()
+    df = tabla.to_pandas()
+
+    # ✅ Normalizar nombres de países sobre los valores únicos, no fila a fila
+    codigos, unicos = pd.factorize(df["location"], use_na_sentinel=False)
+    limpios = pd.Index(unicos).astype(str).str.strip().str.title()
+    codigos_limpios, categorias = pd.factorize(limpios)
+    df["location"] = pd.Categorical.from_codes(codigos_limpios[codigos], categories=categorias)
 
     return df
 
@@ -57,8 +218,7 @@ def chequeos_entrada(leer_datos: pd.DataFrame) -> dg.AssetCheckResult:
 
     # Verificar países
     if "location" in leer_datos.columns:
-        locations = leer_datos["location"].astype(str).str.strip().str.title()
-        paises_encontrados = locations.isin(PERU_ECUADOR).any()
+        paises_encontrados = leer_datos["location"].isin(PERU_ECUADOR).any()
         rules.append({
             "rule": "datos de Perú o Ecuador presentes",
             "passed": bool(paises_encontrados)
@@ -72,7 +232,7 @@ def chequeos_entrada(leer_datos: pd.DataFrame) -> dg.AssetCheckResult:
     # Validar fechas
     if "date" in leer_datos.columns:
         try:
-            max_date = pd.to_datetime(leer_datos["date"]).max()
+            max_date = leer_datos["date"].max()
             today = pd.to_datetime(datetime.today().date())
             fecha_valida = max_date <= today + pd.Timedelta(days=30)
         except Exception:
@@ -83,7 +243,8 @@ def chequeos_entrada(leer_datos: pd.DataFrame) -> dg.AssetCheckResult:
 
     # Unicidad (location, date)
     if "location" in leer_datos.columns and "date" in leer_datos.columns:
-        duplicated = leer_datos.duplicated(subset=["location", "date"]).sum()
+        # ✅ Contar grupos en lugar de construir una máscara booleana de N filas
+        duplicated = _contar_duplicados(leer_datos, ["location", "date"])
     else:
         duplicated = 0
     rules.append({
@@ -133,20 +294,60 @@ def chequeos_entrada(leer_datos: pd.DataFrame) -> dg.AssetCheckResult:
     return dg.AssetCheckResult(passed=passed, metadata=metadata)
 
 
+# ---------------------------------------------------------
+# Asset: Perfilado de los datos de entrada
+# ---------------------------------------------------------
+@dg.asset(
+    description="Perfilado básico (rangos, nulos y fechas) de los datos de Ecuador y Perú."
+)
+def perfilado(leer_datos: pd.DataFrame) -> pd.DataFrame:
+    output_path = "/workspaces/Proyecto-dagster-covid/tabla_perfilado.csv"
+
+    perfil = pd.DataFrame([{
+        "columnas": str(list(leer_datos.columns)),
+        "tipos": str(leer_datos.dtypes.to_dict()),
+        "new_cases_min": float(leer_datos["new_cases"].min()),
+        "new_cases_max": float(leer_datos["new_cases"].max()),
+        "missing_new_cases_pct": float(leer_datos["new_cases"].isna().mean() * 100),
+        "missing_people_vaccinated_pct": float(leer_datos["people_vaccinated"].isna().mean() * 100),
+        "fecha_min": str(leer_datos["date"].min().date()),
+        "fecha_max": str(leer_datos["date"].max().date())
+    }])
+
+    try:
+        perfil.to_csv(output_path, index=False)
+    except Exception as e:
+        raise RuntimeError(f"Error al escribir el perfilado: {e}")
+
+    return perfil
+
+
 # ---------------------------------------------------------
 # Asset: Datos procesados
 # ---------------------------------------------------------
 @dg.asset(
-    description="Filtra y limpia datos para Ecuador y Perú."
+    description="Limpia los datos de Ecuador y Perú (nulos y duplicados)."
 )
 def datos_procesados(leer_datos: pd.DataFrame) -> pd.DataFrame:
-    df = leer_datos[leer_datos["location"].isin(PERU_ECUADOR)].copy()
-    df = df.dropna(subset=["new_cases", "people_vaccinated"])
+    # leer_datos ya trae solo Ecuador y Perú
+    df = leer_datos.assign(location=leer_datos["location"].astype(str))
+    # ✅ Fechas no parseables llegan como NaT: fuera junto con los demás nulos
+    df = df.dropna(subset=["date", "new_cases", "people_vaccinated"])
     
     # ✅ Eliminar duplicados (mantener último)
-    if df.duplicated(subset=["location", "date"]).any():
+    if _contar_duplicados(df, ["location", "date"]) > 0:
         df = df.drop_duplicates(subset=["location", "date"], keep="last")
-    
+
+    # ✅ float32 basta para estas magnitudes; las sumas móviles acumulan en float64
+    df = df.astype({
+        "new_cases": np.float32,
+        "people_vaccinated": np.float32,
+        "population": np.float32,
+    })
+
+    # ✅ Orden único para todo el pipeline: las métricas asumen (location, date) ordenado
+    df = df.sort_values(["location", "date"], kind="mergesort", ignore_index=True)
+
     return df[["location", "date", "new_cases", "people_vaccinated", "population"]]
 
 
@@ -157,15 +358,11 @@ def datos_procesados(leer_datos: pd.DataFrame) -> pd.DataFrame:
     description="Calcula incidencia acumulada por 100k habitantes (promedio móvil 7 días)."
 )
 def metrica_incidencia_7d(datos_procesados: pd.DataFrame) -> pd.DataFrame:
-    df = datos_procesados.copy()
-    df["incidencia_diaria"] = (df["new_cases"] / df["population"]) * 100000
-    df = df.sort_values(["location", "date"])
-    df["incidencia_7d"] = (
-        df.groupby("location")["incidencia_diaria"]
-        .rolling(7)
-        .mean()
-        .reset_index(0, drop=True)
+    df = datos_procesados.assign(
+        incidencia_diaria=(datos_procesados["new_cases"] / datos_procesados["population"]) * 100000
     )
+    inicios = _inicios_segmentos(df)
+    df = df.assign(incidencia_7d=_suma_movil(df["incidencia_diaria"].to_numpy(), inicios) / 7)
     return df[["date", "location", "incidencia_7d"]].dropna()
 
 
@@ -176,29 +373,27 @@ def metrica_incidencia_7d(datos_procesados: pd.DataFrame) -> pd.DataFrame:
     description="Calcula el factor de crecimiento semanal (casos semana actual vs anterior)."
 )
 def metrica_factor_crec_7d(datos_procesados: pd.DataFrame) -> pd.DataFrame:
-    df = datos_procesados.copy()
-    df = df.sort_values(["location", "date"])
-    res = []
-    for loc, g in df.groupby("location"):
-        # ✅ No usar set_index("date")
-        actual = g["new_cases"].rolling(7).sum()
-        previa = g["new_cases"].shift(7).rolling(7).sum()
-        factor = actual / previa
+    df = datos_procesados
+    inicios = _inicios_segmentos(df)
+    casos = df["new_cases"].to_numpy()
 
-        # ✅ Manejar inf y NaN
-        factor = factor.replace([float('inf'), float('-inf')], None)
-        factor = factor.fillna(0)
+    # ✅ Una sola suma acumulada: la semana previa es la actual desplazada 7 filas
+    actual = _suma_movil(casos, inicios)
+    previa = _desplazar(actual, inicios, 7)
 
-        tmp = pd.DataFrame({
-            "date": g["date"],
-            "location": loc,
-            "casos_semana": actual.values,
-            "factor_crec_7d": factor.values
-        })
-        res.append(tmp)
-    
-    result = pd.concat(res).dropna(subset=["factor_crec_7d"])
-    return result[(result["factor_crec_7d"] >= 0) & (result["factor_crec_7d"] <= 10)]
+    # ✅ Manejar inf y NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = actual / previa
+    factor[~np.isfinite(factor)] = 0.0
+
+    # ✅ Filtrar en NumPy y construir el DataFrame de salida una sola vez
+    en_rango = (factor >= 0) & (factor <= 10)
+    return pd.DataFrame({
+        "date": df["date"].to_numpy()[en_rango],
+        "location": df["location"].to_numpy()[en_rango],
+        "casos_semana": actual[en_rango].astype(np.float32),
+        "factor_crec_7d": factor[en_rango].astype(np.float32)
+    })
 
 
 # ---------------------------------------------------------
@@ -234,71 +429,61 @@ def reporte_excel_covid(
 ) -> str:
     output_path = "/workspaces/Proyecto-dagster-covid/reporte_covid.xlsx"
 
-    # Asegurar que 'date' sea datetime
-    df_incidencia = metrica_incidencia_7d.copy()
-    df_factor = metrica_factor_crec_7d.copy()
-    df_incidencia["date"] = pd.to_datetime(df_incidencia["date"])
-    df_factor["date"] = pd.to_datetime(df_factor["date"])
-
     # Pivotear incidencia
-    df_incidencia_pivot = df_incidencia.pivot_table(
+    # 'date' ya llega como datetime64 desde leer_datos
+    df_incidencia_pivot = metrica_incidencia_7d.pivot(
         index="date",
         columns="location",
-        values="incidencia_7d",
-        aggfunc="first"
+        values="incidencia_7d"
     ).reset_index()
-    df_incidencia_pivot.columns.name = ""
     df_incidencia_pivot = df_incidencia_pivot.rename_axis(None, axis=1)
 
-    # Pivotear factor y casos
-    df_factor_pivot = df_factor.pivot_table(
-        index="date",
-        columns="location",
-        values="factor_crec_7d",
-        aggfunc="first"
-    ).reset_index()
-    df_factor_pivot.columns.name = ""
-    df_factor_pivot = df_factor_pivot.rename_axis(None, axis=1)
-
-    df_casos_pivot = df_factor.pivot_table(
+    # ✅ Pivotear factor y casos en una sola pasada
+    df_factor_final = metrica_factor_crec_7d.pivot(
         index="date",
         columns="location",
-        values="casos_semana",
-        aggfunc="first"
-    ).reset_index()
-    df_casos_pivot.columns.name = ""
-    df_casos_pivot = df_casos_pivot.rename_axis(None, axis=1)
-    df_casos_pivot = df_casos_pivot.add_suffix("_casos")
-    df_casos_pivot = df_casos_pivot.rename(columns={"date_casos": "date"})
+        values=["factor_crec_7d", "casos_semana"]
+    )
+    df_factor_final.columns = [
+        f"{loc}_casos" if valor == "casos_semana" else loc
+        for valor, loc in df_factor_final.columns
+    ]
+    df_factor_final = df_factor_final.reset_index()
 
-    # Combinar
-    df_factor_final = pd.merge(df_factor_pivot, df_casos_pivot, on="date", how="left")
+    # Reordenar: Ecuador primero (una sola pasada sobre las columnas)
+    orden_paises = ["Ecuador", "Peru"]
 
-    # Reordenar: Ecuador primero
     def reorder_columns(df):
-        cols = ["date"]
-        ecu = [col for col in df.columns if "Ecuador" in str(col)]
-        per = [col for col in df.columns if "Peru" in str(col)]
-        other = [col for col in df.columns if col not in cols + ecu + per]
-        return df[cols + ecu + per + other]
+        por_pais = {pais: [] for pais in orden_paises}
+        other = []
+        for col in df.columns:
+            if col != "date":
+                por_pais.get(str(col).removesuffix("_casos"), other).append(col)
+        return df[["date"] + [col for pais in orden_paises for col in por_pais[pais]] + other]
 
     df_incidencia_pivot = reorder_columns(df_incidencia_pivot)
     df_factor_final = reorder_columns(df_factor_final)
 
     # Exportar a Excel con formato
+    hojas = {
+        "Incidencia 7D": df_incidencia_pivot,
+        "Factor Crecimiento": df_factor_final,
+    }
+    # ✅ Fechas centradas y en formato ISO: el estilo viaja con cada celda al
+    # escribirla (el writer impone su formato de fecha, por eso se repite aquí)
+    estilo_fecha = {"text-align": "center", "number-format": "yyyy-mm-dd"}
     try:
-        with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-            df_incidencia_pivot.to_excel(writer, sheet_name="Incidencia 7D", index=False)
-            df_factor_final.to_excel(writer, sheet_name="Factor Crecimiento", index=False)
-
-            # Formatear fechas
-            for sheet_name in writer.sheets:
-                ws = writer.sheets[sheet_name]
-                for row in ws.iter_rows(min_row=2, max_col=1):
-                    for cell in row:
-                        if isinstance(cell.value, pd.Timestamp):
-                            cell.number_format = "yyyy-mm-dd"
-                            cell.alignment = cell.alignment.copy(horizontal='center')
+        with pd.ExcelWriter(
+            output_path,
+            engine="xlsxwriter",
+            date_format="yyyy-mm-dd",
+            datetime_format="yyyy-mm-dd"
+        ) as writer:
+            for sheet_name, df in hojas.items():
+                df.style.set_properties(subset=["date"], **estilo_fecha).to_excel(
+                    writer, sheet_name=sheet_name, index=False
+                )
+                writer.sheets[sheet_name].set_column(0, 0, 12)
 
     except Exception as e:
         raise RuntimeError(f"Error al escribir el archivo Excel: {e}")
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+from ProyectoFinal.defs.assets import (
+    _contar_duplicados,
+    _desplazar,
+    _inicios_segmentos,
+    _suma_movil,
+    datos_procesados,
+    metrica_incidencia_7d,
+)
+
+
+def _frame_por_pais() -> pd.DataFrame:
+    """Frame ordenado por location con NaN, ±inf y un país con menos de 7 filas."""
+    ecuador = np.arange(1.0, 13.0)
+    ecuador[3] = np.nan
+    ecuador[9] = np.inf
+    peru = np.arange(20.0, 40.0)
+    peru[11] = -np.inf
+    return pd.DataFrame({
+        "location": ["Chile"] * 4 + ["Ecuador"] * 12 + ["Peru"] * 20,
+        "x": np.concatenate([[1.0, 2.0, 3.0, 4.0], ecuador, peru]),
+    })
+
+
+def test_inicios_segmentos():
+    df = _frame_por_pais()
+    np.testing.assert_array_equal(_inicios_segmentos(df), [0, 4, 16])
+    assert len(_inicios_segmentos(df.iloc[:0])) == 0
+
+
+def test_suma_movil_equivale_a_rolling():
+    df = _frame_por_pais()
+    esperado = df.groupby("location")["x"].rolling(7).sum().reset_index(level=0, drop=True)
+
+    obtenido = _suma_movil(df["x"].to_numpy(), _inicios_segmentos(df))
+
+    np.testing.assert_allclose(obtenido, esperado.to_numpy(), equal_nan=True)
+
+
+def test_desplazar_equivale_a_shift():
+    df = _frame_por_pais()
+    esperado = df.groupby("location")["x"].shift(7)
+
+    obtenido = _desplazar(df["x"].to_numpy(), _inicios_segmentos(df), 7)
+
+    np.testing.assert_array_equal(obtenido, esperado.to_numpy())
+
+
+def test_contar_duplicados_equivale_a_duplicated():
+    df = pd.DataFrame({
+        "location": ["Peru", "Peru", "Peru", "Ecuador", "Ecuador", None],
+        "date": pd.to_datetime(
+            ["2021-01-01", "2021-01-01", None, None, "2021-01-02", None]
+        ),
+    })
+    df = pd.concat([df, df.iloc[[2, 3, 5]]], ignore_index=True)
+    claves = ["location", "date"]
+
+    assert _contar_duplicados(df, claves) == df.duplicated(subset=claves).sum()
+
+
+def test_incidencia_con_poblacion_cero_no_afecta_otras_ventanas():
+    n = 20
+    df = pd.DataFrame({
+        "location": ["Ecuador"] * n + ["Peru"] * n,
+        "date": list(pd.date_range("2021-01-01", periods=n)) * 2,
+        "new_cases": np.arange(2.0 * n),
+        "people_vaccinated": 1.0,
+        "population": 1e6,
+    })
+    df.loc[5, "population"] = 0.0
+
+    diaria = df["new_cases"] / df["population"] * 100000
+    esperado = (
+        diaria.groupby(df["location"]).rolling(7).mean().reset_index(level=0, drop=True).dropna()
+    )
+
+    resultado = metrica_incidencia_7d(df)
+
+    np.testing.assert_allclose(resultado["incidencia_7d"].to_numpy(), esperado.to_numpy())
+    assert (resultado["location"] == "Peru").sum() == n - 6
+
+
+def test_datos_procesados_descarta_fechas_nat():
+    df = pd.DataFrame({
+        "location": pd.Categorical(["Peru", "Peru", "Ecuador"]),
+        "date": pd.to_datetime(["2021-01-01", None, "2021-01-01"]),
+        "new_cases": [1.0, 2.0, 3.0],
+        "people_vaccinated": [1.0, 1.0, 1.0],
+        "population": [1e6, 1e6, 1e6],
+    })
+
+    resultado = datos_procesados(df)
+
+    assert resultado["date"].notna().all()
+    assert len(resultado) == 2